@@ -1,14 +1,27 @@
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, InsertOne, WriteConcern
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 from datetime import datetime
-import numpy as np
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterator
 import logging
 import hashlib
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
 class GenericMongo:
-    def __init__(self, connection_string: str, database_name: str, collection_name: str):
+    def __init__(self, connection_string: str, database_name: str, collection_name: str,
+                 unique_fields: tuple = (), lookup_fields: tuple = ()):
         """
         Generic MongoDB handler for DataFrame operations
         
@@ -16,127 +29,291 @@ class GenericMongo:
             connection_string: MongoDB connection string
             database_name: Database name
             collection_name: Collection name
+            unique_fields: Fields to build unique indexes on at startup (e.g. ('npi',))
+            lookup_fields: Fields to build plain indexes on at startup
         """
-        logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
         self.client = MongoClient(connection_string)
         self.db = self.client[database_name]
         self.collection = self.db[collection_name]
+        
+        # Unacknowledged (w=0) view of the collection for insert(fast=True)
+        self._fast_collection = self.collection.with_options(write_concern=WriteConcern(w=0))
+        
+        # Fields already known to carry a unique index on this collection
+        self._unique_indexes = set()
+        
+        # Unique fields ensure_indexes has already handled, successfully or not
+        self._checked_unique_fields = set()
+        
+        # Values of unique fields already stored, filled by preload_unique_values
+        self._known_values: Dict[str, set] = {}
+        
+        # Build the index set once up front instead of checking on every insert
+        if unique_fields or lookup_fields:
+            self.ensure_indexes(unique_fields=unique_fields, lookup_fields=lookup_fields)
     
-    def _convert_nan_to_none(self, value):
-        """Convert NaN values to None for MongoDB compatibility"""
-        if pd.isna(value):
-            return None
-        return value
+    def ensure_indexes(self, unique_fields: tuple = (), lookup_fields: tuple = ()) -> bool:
+        """Create the unique and lookup indexes in one round-trip, skipping those already present
+        
+        Args:
+            unique_fields: Fields that get a unique index
+            lookup_fields: Fields that get a plain (non-unique) index
+            
+        Returns:
+            True if all indexes are in place
+        """
+        try:
+            existing = {
+                tuple(index['key']): index.get('unique', False)
+                for index in self.collection.index_information().values()
+            }
+            
+            models = []
+            created = []
+            for field in unique_fields:
+                self._checked_unique_fields.add(field)
+                key = ((field, 1),)
+                if existing.get(key):
+                    self._unique_indexes.add(field)
+                elif key in existing:
+                    # A non-unique index with the same key and name blocks the unique one
+                    self.logger.warning(f"Non-unique index on {field} already exists, unique index not created")
+                else:
+                    models.append(IndexModel([(field, 1)], unique=True))
+                    created.append(field)
+            for field in lookup_fields:
+                if ((field, 1),) not in existing and field not in unique_fields:
+                    models.append(IndexModel([(field, 1)]))
+            
+            if models:
+                self.collection.create_indexes(models)
+                self.logger.info(f"Created indexes: {[model.document['name'] for model in models]}")
+            self._unique_indexes.update(created)
+            return set(unique_fields) <= self._unique_indexes
+            
+        except Exception as e:
+            # Fields stay in _checked_unique_fields, so insert() does not retry on every chunk
+            self._checked_unique_fields.update(unique_fields)
+            self.logger.warning(f"Could not create indexes {list(unique_fields) + list(lookup_fields)}: {e}")
+            return False
     
-    def _convert_dataframe_row_to_document(self, row: pd.Series) -> Dict:
-        """Convert DataFrame row to MongoDB document"""
-        document = {}
+    def _dataframe_to_documents(self, df: pd.DataFrame) -> List[Dict]:
+        """Convert DataFrame to MongoDB documents in one vectorized pass
         
-        for column, value in row.items():
-            # Convert NaN to None
-            converted_value = self._convert_nan_to_none(value)
-            
-            # Convert numpy types to native Python types
-            if isinstance(converted_value, np.integer):
-                converted_value = int(converted_value)
-            elif isinstance(converted_value, np.floating):
-                converted_value = float(converted_value)
-            elif isinstance(converted_value, np.bool_):
-                converted_value = bool(converted_value)
-            elif isinstance(converted_value, (np.ndarray, list)):
-                converted_value = [self._convert_nan_to_none(item) for item in converted_value]
-            
-            document[column] = converted_value
+        NaN/NaT are replaced with None columnwise; the object cast already
+        yields native Python scalars, so rows are zipped straight into dicts
+        """
+        masked = df.astype(object).where(df.notna(), None)
+        columns = masked.columns.tolist()
+        return [dict(zip(columns, row)) for row in masked.itertuples(index=False, name=None)]
+    
+    def preload_unique_values(self, field: str = 'npi') -> int:
+        """
+        Load all stored values of field into memory so insert() can skip them client-side
         
-        return document
+        Args:
+            field: Unique field to preload (same as unique_field passed to insert)
+            
+        Returns:
+            Number of values loaded
+        """
+        try:
+            cursor = self.collection.find({}, {field: 1, '_id': 0}, batch_size=10_000)
+            if f"{field}_1" in self.collection.index_information():
+                # Covered index scan, documents are never fetched
+                cursor = cursor.hint(f"{field}_1")
+            
+            values = {doc[field] for doc in cursor if field in doc}
+            
+        except Exception as e:
+            self.logger.error(f"Preload operation failed: {str(e)}")
+            return 0
+        
+        self._known_values[field] = values
+        self.logger.info(f"Preloaded {len(values)} values of {field}")
+        return len(values)
     
-    def insert(self, df: pd.DataFrame, unique_field: Optional[str] = None) -> Dict[str, Any]:
+    def insert(self, df: pd.DataFrame, unique_field: Optional[str] = None,
+               batch_size: int = 1000, fast: bool = False) -> Dict[str, Any]:
         """
         Insert DataFrame into MongoDB collection
         
         Args:
             df: DataFrame to insert
             unique_field: Field name to use for uniqueness check (optional)
+            batch_size: Number of documents sent per insert_many call
+            fast: Send unacknowledged (w=0) bulk writes; much higher throughput, but
+                write errors such as duplicates are silently dropped and not counted
             
         Returns:
             Dictionary with insertion results
         """
+        total_processed = len(df)
         try:
-            documents = []
-            errors = []
-            
-            # Convert DataFrame rows to documents
-            for index, row in df.iterrows():
-                try:
-                    document = self._convert_dataframe_row_to_document(row)
-                    
-                    # Add timestamp
-                    document['_inserted_at'] = datetime.utcnow()
-                    
-                    documents.append(document)
-                    
-                except Exception as e:
-                    errors.append(f"Row {index}: {str(e)}")
-            
-            if not documents:
-                return {
-                    "success": False,
-                    "inserted_count": 0,
-                    "total_processed": len(df),
-                    "errors": errors,
-                    "message": "No valid documents to insert"
-                }
+            # Skip rows whose unique value is already stored (or repeated in this DataFrame)
+            known = self._known_values.get(unique_field) if unique_field else None
+            skipped_count = 0
+            if known is not None and unique_field in df.columns:
+                keys = df[unique_field]
+                mask = ~keys.map(known.__contains__).astype(bool) & ~keys.duplicated()
+                skipped_count = total_processed - int(mask.sum())
+                df = df[mask]
             
-            # Create unique index if specified
-            if unique_field:
-                try:
-                    self.collection.create_index(unique_field, unique=True)
-                except Exception as e:
-                    self.logger.warning(f"Could not create unique index on {unique_field}: {e}")
+            # Convert DataFrame to documents
+            documents = self._dataframe_to_documents(df)
             
-            # Insert documents
-            inserted_count = 0
-            try:
-                if unique_field:
-                    # Insert one by one to handle duplicates
-                    for doc in documents:
-                        try:
-                            self.collection.insert_one(doc)
-                            inserted_count += 1
-                        except Exception as insert_error:
-                            if unique_field in doc:
-                                errors.append(f"{unique_field} {doc[unique_field]}: {str(insert_error)}")
-                            else:
-                                errors.append(f"Document: {str(insert_error)}")
-                else:
-                    # Bulk insert
-                    result = self.collection.insert_many(documents, ordered=False)
-                    inserted_count = len(result.inserted_ids)
-                    
-            except Exception as e:
-                errors.append(f"Bulk insert error: {str(e)}")
+            return self._insert_documents(documents, unique_field, batch_size, fast,
+                                          total_processed, skipped_count)
             
-            result = {
-                "success": True,
-                "inserted_count": inserted_count,
-                "total_processed": len(df),
-                "errors": errors
+        except Exception as e:
+            self.logger.error(f"Insert operation failed: {str(e)}")
+            return {
+                "success": False,
+                "inserted_count": 0,
+                "total_processed": total_processed,
+                "errors": [str(e)]
             }
+    
+    def insert_records(self, records: List[Dict], unique_field: Optional[str] = None,
+                       batch_size: int = 1000, fast: bool = False) -> Dict[str, Any]:
+        """
+        Insert ready-made documents (e.g. from NPI_Load.read_csv_in_batches_polars)
+        
+        Args:
+            records: List of documents; NaN must already be None
+            unique_field: Field name to use for uniqueness check (optional)
+            batch_size: Number of documents sent per insert_many call
+            fast: Send unacknowledged (w=0) bulk writes, see insert()
             
-            self.logger.info(f"Inserted {inserted_count} documents out of {len(df)} processed")
-            return result
+        Returns:
+            Dictionary with insertion results
+        """
+        total_processed = len(records)
+        try:
+            # Skip records whose unique value is already stored (or repeated in this batch)
+            known = self._known_values.get(unique_field) if unique_field else None
+            documents = records
+            if known is not None:
+                seen = set()
+                documents = []
+                for doc in records:
+                    value = doc.get(unique_field)
+                    if value in known or value in seen:
+                        continue
+                    seen.add(value)
+                    documents.append(doc)
+            
+            return self._insert_documents(documents, unique_field, batch_size, fast,
+                                          total_processed, total_processed - len(documents))
             
         except Exception as e:
             self.logger.error(f"Insert operation failed: {str(e)}")
             return {
                 "success": False,
                 "inserted_count": 0,
-                "total_processed": len(df),
+                "total_processed": total_processed,
                 "errors": [str(e)]
             }
     
+    def _insert_documents(self, documents: List[Dict], unique_field: Optional[str],
+                          batch_size: int, fast: bool, total_processed: int,
+                          skipped_count: int) -> Dict[str, Any]:
+        """Stamp documents with one insertion time and _id, then write them in batches"""
+        errors = []
+        
+        if not documents:
+            if skipped_count:
+                # Everything was already stored, nothing left to send
+                return {
+                    "success": True,
+                    "inserted_count": 0,
+                    "skipped_count": skipped_count,
+                    "total_processed": total_processed,
+                    "errors": errors
+                }
+            return {
+                "success": False,
+                "inserted_count": 0,
+                "total_processed": total_processed,
+                "errors": errors,
+                "message": "No valid documents to insert"
+            }
+        
+        # Stamp the insert time and assign missing _ids client-side, so each document
+        # carries its final _id before it is sent
+        inserted_at = datetime.utcnow()
+        for document in documents:
+            document['_inserted_at'] = inserted_at
+            if '_id' not in document:
+                document['_id'] = ObjectId()
+        
+        # Create unique index if specified
+        if unique_field and unique_field not in self._checked_unique_fields:
+            self.ensure_indexes(unique_fields=(unique_field,))
+        
+        known = self._known_values.get(unique_field) if unique_field else None
+        
+        if fast:
+            for start in range(0, len(documents), batch_size):
+                batch = documents[start:start + batch_size]
+                self._fast_collection.bulk_write([InsertOne(doc) for doc in batch], ordered=False)
+                # Mark keys only once their batch has been handed off
+                if known is not None:
+                    known.update(doc[unique_field] for doc in batch if unique_field in doc)
+            
+            self.logger.info(f"Sent {len(documents)} documents unacknowledged out of {total_processed} processed")
+            return {
+                "success": True,
+                "inserted_count": None,
+                "sent_count": len(documents),
+                "acknowledged": False,
+                "skipped_count": skipped_count,
+                "total_processed": total_processed,
+                "errors": errors
+            }
+        
+        # Insert documents in unordered batches; duplicates rejected by the
+        # unique index come back in BulkWriteError without extra round-trips
+        inserted_count = 0
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            try:
+                result = self.collection.insert_many(batch, ordered=False)
+                inserted_count += len(result.inserted_ids)
+                stored = batch
+            except BulkWriteError as bwe:
+                inserted_count += bwe.details.get('nInserted', 0)
+                failed = set()
+                for write_error in bwe.details.get('writeErrors', []):
+                    # Duplicate keys (11000) are already stored, anything else was not written
+                    if write_error.get('code') != 11000:
+                        failed.add(write_error['index'])
+                    doc = batch[write_error['index']]
+                    if unique_field and unique_field in doc:
+                        errors.append(f"{unique_field} {doc[unique_field]}: {write_error['errmsg']}")
+                    else:
+                        errors.append(f"Document: {write_error['errmsg']}")
+                stored = [doc for i, doc in enumerate(batch) if i not in failed]
+            except Exception as e:
+                errors.append(f"Bulk insert error: {str(e)}")
+                stored = []
+            
+            if known is not None:
+                known.update(doc[unique_field] for doc in stored if unique_field in doc)
+        
+        result = {
+            "success": True,
+            "inserted_count": inserted_count,
+            "skipped_count": skipped_count,
+            "total_processed": total_processed,
+            "errors": errors
+        }
+        
+        self.logger.info(f"Inserted {inserted_count} documents out of {total_processed} processed")
+        return result
+    
     def update(self, query: Dict, update_data: Union[Dict, pd.DataFrame], 
                upsert: bool = False, multi: bool = False) -> Dict[str, Any]:
         """
@@ -155,7 +332,7 @@ class GenericMongo:
             if isinstance(update_data, pd.DataFrame):
                 # Convert DataFrame to update document
                 if len(update_data) == 1:
-                    update_doc = self._convert_dataframe_row_to_document(update_data.iloc[0])
+                    update_doc = self._dataframe_to_documents(update_data)[0]
                 else:
                     raise ValueError("DataFrame must contain exactly one row for update")
             else:
@@ -186,13 +363,63 @@ class GenericMongo:
                 "error": str(e)
             }
     
-    def exists(self, identifier_value: str, column_name: str) -> Dict[str, Any]:
+    def _column_hash_data(self, document: Dict, columns: List[str]) -> Dict[str, str]:
+        """Stringify specified columns of document for hashing"""
+        hash_data = {}
+        for col in columns:
+            if col in document:
+                value = document[col]
+                # Convert to string for consistent hashing
+                if isinstance(value, (dict, list)):
+                    hash_data[col] = json.dumps(value, sort_keys=True, default=str)
+                else:
+                    hash_data[col] = str(value) if value is not None else ""
+            else:
+                hash_data[col] = ""
+        return hash_data
+    
+    def _hash_columns(self, document: Dict, columns: List[str], hash_algo: str) -> str:
+        """Hash specified columns of document with the given algorithm"""
+        if hash_algo == 'xxh3':
+            hash_data = self._column_hash_data(document, columns)
+            if orjson is not None:
+                blob = orjson.dumps(hash_data, option=orjson.OPT_SORT_KEYS)
+            else:
+                blob = json.dumps(hash_data, sort_keys=True, ensure_ascii=False,
+                                  separators=(',', ':')).encode()
+            return xxhash.xxh3_64_hexdigest(blob)
+        
+        if hash_algo == 'md5':
+            # Legacy scheme, kept for comparing against previously stored hashes
+            hash_string = json.dumps(self._column_hash_data(document, columns), sort_keys=True)
+            return hashlib.md5(hash_string.encode()).hexdigest()
+        
+        if hash_algo == 'blake2b':
+            # Stream values straight into the digest
+            h = hashlib.blake2b(digest_size=16)
+            for col in sorted(columns):
+                value = document.get(col)
+                h.update(col.encode())
+                h.update(b'\x00')
+                if isinstance(value, (dict, list)):
+                    h.update(json.dumps(value, sort_keys=True, default=str, separators=(',', ':')).encode())
+                elif value is not None:
+                    h.update(str(value).encode())
+                h.update(b'\x01')
+            return h.hexdigest()
+        
+        raise ValueError(f"Unsupported hash_algo: {hash_algo}")
+    
+    def exists(self, identifier_value: str, column_name: str,
+               hash_algo: str = 'xxh3') -> Dict[str, Any]:
         """
         Check if document exists and return hash of specified columns
         
         Args:
             identifier_value: Value to search for
             column_name: Column name to search in (or comma-separated list)
+            hash_algo: 'xxh3' (falls back to 'blake2b' without xxhash installed),
+                'blake2b', or 'md5' for the legacy json+md5 hash
             
         Returns:
             Dictionary with existence check and hash sum
@@ -201,8 +428,11 @@ class GenericMongo:
             # Parse column names
             columns = [col.strip() for col in column_name.split(',')]
             
-            # Find document
-            document = self.collection.find_one({columns[0]: identifier_value})
+            # Find document, fetching only the hashed columns
+            document = self.collection.find_one(
+                {columns[0]: identifier_value},
+                projection={col: 1 for col in columns}
+            )
             
             if not document:
                 return {
@@ -211,26 +441,14 @@ class GenericMongo:
                     "identifier": identifier_value
                 }
             
-            # Calculate hash for specified columns
-            hash_data = {}
-            for col in columns:
-                if col in document:
-                    value = document[col]
-                    # Convert to string for consistent hashing
-                    if isinstance(value, (dict, list)):
-                        hash_data[col] = json.dumps(value, sort_keys=True, default=str)
-                    else:
-                        hash_data[col] = str(value) if value is not None else ""
-                else:
-                    hash_data[col] = ""
-            
-            # Create hash string
-            hash_string = json.dumps(hash_data, sort_keys=True)
-            hash_sum = hashlib.md5(hash_string.encode()).hexdigest()
+            if hash_algo == 'xxh3' and xxhash is None:
+                hash_algo = 'blake2b'
+            hash_sum = self._hash_columns(document, columns, hash_algo)
             
             return {
                 "exists": True,
                 "hash": hash_sum,
+                "hash_algo": hash_algo,
                 "identifier": identifier_value,
                 "document_id": str(document.get('_id')),
                 "columns_used": columns
@@ -267,6 +485,27 @@ class GenericMongo:
             self.logger.error(f"Find operation failed: {str(e)}")
             return []
     
+    def iter_find(self, query: Dict = None, projection: Optional[Dict] = None,
+                  batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        Stream documents from collection without loading them all into memory
+        
+        Args:
+            query: MongoDB query (optional, defaults to all documents)
+            projection: Fields to return (optional)
+            batch_size: Number of documents fetched per cursor round-trip
+            
+        Yields:
+            Documents matching the query
+        """
+        if query is None:
+            query = {}
+        try:
+            yield from self.collection.find(query, projection=projection, batch_size=batch_size)
+            
+        except Exception as e:
+            self.logger.error(f"Iter find operation failed: {str(e)}")
+    
     def find_npi(self, npi: str) -> Optional[Dict]:
         """
         Find document by NPI number
@@ -281,26 +520,18 @@ class GenericMongo:
             # Convert to string and remove any non-numeric characters
             npi_clean = str(npi).strip()
             
-            # Try to find by different possible field names
-            possible_fields = ['npi', 'number', 'NPI', 'Number']
-            
-            for field in possible_fields:
-                document = self.collection.find_one({field: npi_clean})
-                if document:
-                    self.logger.info(f"Found NPI {npi_clean} using field '{field}'")
-                    return document
-            
-            # If not found with string, try with integer conversion
+            # Stored npi can be a string or a pandas-parsed integer; match both in one query
+            candidates = [npi_clean]
             try:
-                npi_int = int(float(npi_clean))
-                for field in possible_fields:
-                    document = self.collection.find_one({field: npi_int})
-                    if document:
-                        self.logger.info(f"Found NPI {npi_clean} as integer using field '{field}'")
-                        return document
+                candidates.append(int(float(npi_clean)))
             except ValueError:
                 pass
             
+            document = self.collection.find_one({'npi': {'$in': candidates}})
+            if document:
+                self.logger.info(f"Found NPI {npi_clean}")
+                return document
+            
             self.logger.info(f"NPI {npi_clean} not found")
             return None
             
@@ -2,25 +2,42 @@ from parser.load_npi import NPI_Load
 from parser.npi_maper import NPIDataFrameMapper
 from db.mongo import GenericMongo
 import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
 load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 mongodb = GenericMongo(
         connection_string=os.getenv("MONGO_URL"),
         database_name=os.getenv("DATABASE_NAME"),
-        collection_name=os.getenv("COLLECTION_NAME")
+        collection_name=os.getenv("COLLECTION_NAME"),
+        unique_fields=('npi',)
         )
 
-load = NPI_Load("DAC_NationalDownloadableFile.csv")
+# Inserts run in worker threads (pymongo releases the GIL on socket I/O) while
+# the main thread parses the next chunk; at most INSERT_WORKERS chunks in flight
+INSERT_WORKERS = 4
+
+# Parse with polars and insert its records directly instead of pandas DataFrames
+# (npi is stored as int either way; polars keeps every other column as a string)
+USE_POLARS = False
 
 mapper = NPIDataFrameMapper()
-for i, chunk in enumerate(load.read_csv_in_chunks(chunk_size=10)):
-        chunk = load.normalize_columns(chunk)
-        for idx in range(len(chunk)):
-            row_df = chunk.iloc[[idx]]
-            mongodb.insert(row_df, unique_field='npi')
-        break
+with NPI_Load("DAC_NationalDownloadableFile.csv") as load, \
+        ThreadPoolExecutor(max_workers=INSERT_WORKERS) as executor:
+    if USE_POLARS:
+        chunks = load.read_csv_in_batches_polars(chunk_size=50_000)
+        insert = mongodb.insert_records
+    else:
+        chunks = (load.normalize_columns(chunk) for chunk in load.read_csv_in_chunks(chunk_size=50_000))
+        insert = mongodb.insert
+    pending = set()
+    for chunk in chunks:
+        if len(pending) >= INSERT_WORKERS:
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        pending.add(executor.submit(insert, chunk, unique_field='npi'))
 exists_after_update = mongodb.find_npi('1003000126')
 print(exists_after_update)
 mongodb.close()
\ No newline at end of file
@@ -4,10 +4,47 @@ import pandas as pd
 from pandas import DataFrame
 from typing import Optional, Dict, List, Generator, Any
 import os
+import logging
+import tempfile
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    import pyarrow  # noqa: F401 - enables pandas engine='pyarrow'
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
+
+_DROP_PARENS = str.maketrans('', '', '()')
+_NON_ALNUM_RUN = re.compile(r'[^a-z0-9]+')
+
+
+def _normalize_column_name(col: str) -> str:
+    """snake_case column name: drop ( & ), any run of other non-alnum chars -> single _, strip _"""
+    col = col.lower().translate(_DROP_PARENS)
+    return _NON_ALNUM_RUN.sub('_', col).strip('_')
 
 
 class NPI_Load:
-    def __init__(self, file_path: str, prefix: str = "", csv_filename: Optional[str] = None):
+    # Low-cardinality NPPES columns, parsed as category instead of object strings
+    _DEFAULT_DTYPES: Dict[str, Any] = {
+        'Provider Gender Code': 'category',
+        'Is Sole Proprietor': 'category',
+        'Is Organization Subpart': 'category',
+        'Provider Business Mailing Address State Name': 'category',
+        'Provider Business Mailing Address Country Code (If outside U.S.)': 'category',
+        'Provider Business Practice Location Address State Name': 'category',
+        'Provider Business Practice Location Address Country Code (If outside U.S.)': 'category',
+        **{f'Healthcare Provider Taxonomy Code_{i}': 'category' for i in range(1, 16)},
+        **{f'Healthcare Provider Primary Taxonomy Switch_{i}': 'category' for i in range(1, 16)},
+    }
+    
+    def __init__(self, file_path: str, prefix: str = "", csv_filename: Optional[str] = None,
+                 validate_crc: bool = False, downcast_ints: bool = False):
         """
         Initialization of the class for working with NPI data in a CSV or ZIP file
 
@@ -18,11 +55,25 @@ file_path (str): Path to the CSV or ZIP file
 prefix (str): Prefix used to search for CSV files in the ZIP (ignored for standalone CSV)
 
 csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if known)
+
+validate_crc (bool): Read the whole ZIP and check CRC of every member (slow on large archives)
+
+downcast_ints (bool): Downcast parsed int64 columns to the smallest integer type (less DataFrame memory, no effect on stored documents)
         """
+        self.logger = logging.getLogger(__name__)
+        
         self.file_path = file_path
         self.prefix = prefix.lower() if prefix else ""
         self.csv_filename = csv_filename
         self.is_zip = file_path.lower().endswith('.zip')
+        self.validate_crc = validate_crc
+        self.downcast_ints = downcast_ints
+        
+        # (columns, rename map) from the last normalize_columns call
+        self._col_rename_cache = None
+        
+        # ZipFile opened once and shared by all reads until close()
+        self._zip: Optional[zipfile.ZipFile] = None
         
         # Valide file in init
         self._validate_file()
@@ -36,8 +87,14 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
         
         if self.is_zip:
             try:
-                with zipfile.ZipFile(self.file_path, 'r') as z:
-                    z.testzip()
+                z = self._get_zip()
+                # Opening parses the central directory; full CRC scan only on request
+                if not z.infolist():
+                    raise zipfile.BadZipFile("archive is empty")
+                if self.validate_crc:
+                    bad_member = z.testzip()
+                    if bad_member:
+                        raise zipfile.BadZipFile(f"CRC check failed for {bad_member}")
             except (zipfile.BadZipFile, FileNotFoundError) as e:
                 raise ValueError(f"Non correct Zip: {self.file_path}. Exp: {e}")
         else:
@@ -45,46 +102,59 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
                 raise ValueError(f"Only for CVS or Zip: {self.file_path}")
     
     def _find_csv_file(self) -> None:
-        with zipfile.ZipFile(self.file_path, 'r') as z:
-            csv_files = [
-                f for f in z.namelist() 
-                if f.lower().endswith('.csv') and f.lower().startswith(self.prefix)
-            ]
-            
-            if not csv_files:
-                #if not find prefix , we just pick first file
-                all_csv_files = [f for f in z.namelist() if f.lower().endswith('.csv')]
-                if all_csv_files:
-                    self.csv_filename = all_csv_files[0]
-                    print(f"File which '{self.prefix}' Non find. Use: {self.csv_filename}")
-                else:
-                    raise ValueError(f"CSV Not find in Zip \n Set file_patch in method: {self.file_path}")
+        z = self._get_zip()
+        csv_files = [
+            f for f in z.namelist() 
+            if f.lower().endswith('.csv') and f.lower().startswith(self.prefix)
+        ]
+        
+        if not csv_files:
+            #if not find prefix , we just pick first file
+            all_csv_files = [f for f in z.namelist() if f.lower().endswith('.csv')]
+            if all_csv_files:
+                self.csv_filename = all_csv_files[0]
+                self.logger.warning(f"File which '{self.prefix}' Non find. Use: {self.csv_filename}")
             else:
-                self.csv_filename = csv_files[0]
-                print(f"CVS File Find: {self.csv_filename}")
+                raise ValueError(f"CSV Not find in Zip \n Set file_patch in method: {self.file_path}")
+        else:
+            self.csv_filename = csv_files[0]
+            self.logger.info(f"CVS File Find: {self.csv_filename}")
+    
+    def _get_zip(self) -> zipfile.ZipFile:
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.file_path, 'r')
+        return self._zip
     
     def _get_file_handle(self):
         if self.is_zip:
-            zip_file = zipfile.ZipFile(self.file_path, 'r')
-            csv_file = zip_file.open(self.csv_filename)
-            return zip_file, csv_file
+            return self._get_zip().open(self.csv_filename)
         else:
-            return None, open(self.file_path, 'r', encoding='utf-8')
+            return open(self.file_path, 'r', encoding='utf-8')
+    
+    def close(self) -> None:
+        """Close the cached ZIP archive (reopened lazily on next read)"""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+    
+    def __enter__(self) -> "NPI_Load":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
     
     def read_csv_head(self, n: int = 10) -> pd.DataFrame:
         """DEV method for check file structure 
         """
-        zip_file, csv_file = self._get_file_handle()
+        csv_file = self._get_file_handle()
         
         try:
             filename = self.csv_filename if self.is_zip else os.path.basename(self.file_path)
-            print(f"Read {n} in : {filename}")
+            self.logger.info(f"Read {n} in : {filename}")
             df_head = pd.read_csv(csv_file, nrows=n)
             return df_head
         finally:
             csv_file.close()
-            if zip_file:
-                zip_file.close()
     
     def get_schema_from_sample(self, sample_size: int = 100) -> Dict[str, str]:
         """
@@ -96,7 +166,7 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
         Returns:
             Dict[str, str]: Type and Name
         """
-        zip_file, csv_file = self._get_file_handle()
+        csv_file = self._get_file_handle()
         
         try:
             df_sample = pd.read_csv(csv_file, nrows=sample_size)
@@ -104,8 +174,6 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
             return schema
         finally:
             csv_file.close()
-            if zip_file:
-                zip_file.close()
     
     def read_csv_in_chunks(self, 
                           chunk_size: int = 100_000, 
@@ -122,54 +190,80 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
         Yields:
             pd.DataFrame: Part Data
         """
-        zip_file, csv_file = self._get_file_handle()
+        csv_file = self._get_file_handle()
         
         try:
             chunk_iter = pd.read_csv(
                 csv_file,
                 chunksize=chunk_size,
-                dtype=dtype_map,
+                dtype={**self._DEFAULT_DTYPES, **(dtype_map or {})},
                 parse_dates=date_cols,
                 low_memory=False
             )
             
             for i, chunk in enumerate(chunk_iter):
-                print(f"Chunk {i + 1}: {len(chunk)} len")
-                yield chunk
+                self.logger.debug("Chunk %d: %d len", i + 1, len(chunk))
+                if (i + 1) % 100 == 0:
+                    self.logger.info(f"Read {i + 1} chunks")
+                yield self._coerce(chunk, dtype_map)
         finally:
             csv_file.close()
-            if zip_file:
-                zip_file.close()
     
     def read_full_csv(self, 
                      dtype_map: Optional[Dict[str, Any]] = None, 
-                     date_cols: Optional[List[str]] = None) -> pd.DataFrame:
+                     date_cols: Optional[List[str]] = None,
+                     engine: Optional[str] = None) -> pd.DataFrame:
         """
         Чтение всего CSV файла целиком
         
         Args:
             dtype_map (Dict, optional): Словарь типов данных для колонок
             date_cols (List[str], optional): Список колонок для парсинга дат
+            engine (str, optional): Парсер pandas; по умолчанию 'pyarrow' если он установлен
+                и dtype_map не задан, иначе 'c'
             
         Returns:
             pd.DataFrame: Полный DataFrame
         """
-        zip_file, csv_file = self._get_file_handle()
+        csv_file = self._get_file_handle()
         
         try:
             filename = self.csv_filename if self.is_zip else os.path.basename(self.file_path)
-            print(f"Чтение полного файла: {filename}")
+            self.logger.info(f"Чтение полного файла: {filename}")
+            if engine is None:
+                engine = 'pyarrow' if _HAS_PYARROW and dtype_map is None else 'c'
+            
+            if engine == 'pyarrow':
+                # pandas' pyarrow engine fails on a dtype dict when any integer column
+                # has nulls, so the category defaults are applied after parsing
+                df = pd.read_csv(csv_file, dtype=dtype_map, parse_dates=date_cols, engine='pyarrow')
+                categories = {col: dtype for col, dtype in self._DEFAULT_DTYPES.items()
+                              if col in df.columns and not (dtype_map and col in dtype_map)}
+                return self._coerce(df.astype(categories), dtype_map)
+            
             df = pd.read_csv(
                 csv_file,
-                dtype=dtype_map,
+                dtype={**self._DEFAULT_DTYPES, **(dtype_map or {})},
                 parse_dates=date_cols,
                 low_memory=False
             )
-            return df
+            return self._coerce(df, dtype_map)
         finally:
             csv_file.close()
-            if zip_file:
-                zip_file.close()
+    
+    def _coerce(self, df: pd.DataFrame, dtype_map: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Downcast int64 columns (NPI, PAC ids, ...) to the smallest integer type holding their values
+        
+        Only with downcast_ints; columns typed by the caller's dtype_map are left as requested
+        """
+        if not self.downcast_ints:
+            return df
+        
+        for col in df.select_dtypes(include='integer').columns:
+            if dtype_map and col in dtype_map:
+                continue
+            df[col] = pd.to_numeric(df[col], downcast='unsigned' if df[col].min() >= 0 else 'integer')
+        return df
     
     def normalize_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -181,21 +275,59 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
         Returns:
             pd.DataFrame: DataFrame с нормализованными именами колонок
         """
-        # snake_case
-        cols = df.columns.str.lower().str.replace(r'\s+', '_', regex=True)
-        
-        # del ( & )
-        cols = cols.str.replace(r'[\(\)]', '', regex=True)
+        return df.rename(columns=self._column_rename_map(df.columns))
+    
+    def _column_rename_map(self, columns) -> Dict[str, str]:
+        columns = tuple(columns)
+        if self._col_rename_cache is None or self._col_rename_cache[0] != columns:
+            # Columns are identical across chunks of one file, so build the map once
+            rename_map = {col: _normalize_column_name(col) for col in columns}
+            self._col_rename_cache = (columns, rename_map)
         
-        cols = cols.str.replace(r'[^a-zA-Z0-9_]', '_', regex=True)
+        return self._col_rename_cache[1]
+    
+    def read_csv_in_batches_polars(self, chunk_size: int = 100_000) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        chunks CSV with polars (Rust parser), records ready for insert_many
         
-        # Multiple _ 
-        cols = cols.str.replace(r'_+', '_', regex=True)
+        Args:
+            chunk_size (int): Size one part
+            
+        Yields:
+            List[Dict]: Part Data as documents, columns normalized like normalize_columns,
+            npi as int like the pandas path, other values as str, missing values as None
+        """
+        if pl is None:
+            raise ImportError("polars is required for read_csv_in_batches_polars: pip install polars")
         
-        # Del _ in start and end
-        cols = cols.str.strip('_')
+        # polars reads a stream fully into memory before the first batch, so a
+        # ZIP member is extracted to a temporary file and scanned by path
+        tmp_dir = tempfile.TemporaryDirectory() if self.is_zip else None
         
-        return df.rename(columns=dict(zip(df.columns, cols)))
+        try:
+            if tmp_dir is not None:
+                csv_path = self._get_zip().extract(self.csv_filename, tmp_dir.name)
+            else:
+                csv_path = self.file_path
+            
+            # Types inferred from leading rows break on later values (foreign postal
+            # codes, ...), so every column is read as a string
+            lazy = pl.scan_csv(csv_path, infer_schema=False,
+                               # NPPES quotes empty fields too; "" is missing, not an empty string
+                               null_values=[''])
+            lazy = lazy.rename(self._column_rename_map(lazy.collect_schema().names()))
+            if 'npi' in lazy.collect_schema().names():
+                # Same int key as the pandas path, so both loaders dedupe against one npi index
+                lazy = lazy.with_columns(pl.col('npi').cast(pl.Int64))
+            
+            for i, batch in enumerate(lazy.collect_batches(chunk_size=chunk_size)):
+                self.logger.debug("Batch %d: %d len", i + 1, batch.height)
+                if (i + 1) % 100 == 0:
+                    self.logger.info(f"Read {i + 1} batches")
+                yield batch.to_dicts()
+        finally:
+            if tmp_dir is not None:
+                tmp_dir.cleanup()
     
     def get_file_info(self) -> Dict[str, Any]:
         """
@@ -214,14 +346,13 @@ csv_filename (str, optional): Specific name of the CSV file inside the ZIP (if k
             info['csv_filename'] = self.csv_filename
             info['prefix'] = self.prefix
             
-            with zipfile.ZipFile(self.file_path, 'r') as z:
-                zip_info = z.getinfo(self.csv_filename)
-                info.update({
-                    'file_size_compressed': zip_info.compress_size,
-                    'file_size_uncompressed': zip_info.file_size,
-                    'compression_type': zip_info.compress_type,
-                    'date_time': zip_info.date_time
-                })
+            zip_info = self._get_zip().getinfo(self.csv_filename)
+            info.update({
+                'file_size_compressed': zip_info.compress_size,
+                'file_size_uncompressed': zip_info.file_size,
+                'compression_type': zip_info.compress_type,
+                'date_time': zip_info.date_time
+            })
         else:
             info['csv_filename'] = os.path.basename(self.file_path)
         